@@ -0,0 +1,204 @@
+import random
+from collections import namedtuple
+from functools import lru_cache
+import numpy as np
+import board_nb
+
+# Constants
+SYMBOLS = ["B", "G", "P", "O"]
+EMPTY = " "
+SYMBOL_TO_INDEX = {symbol: i for i, symbol in enumerate([EMPTY] + SYMBOLS)}
+MAX_CELLS = 63 # Largest board that fits in a (signed) 64-bit mask
+
+# The board is stored as one bitmask per color (a bitboard). Cell (x, y) is bit y * width + x.
+State = namedtuple("State", SYMBOLS + ["width", "height"])
+
+# Random 64-bit keys for every (color, cell) pair, used to hash board states
+_zobrist_rng = random.Random(0)
+ZOBRIST = [[_zobrist_rng.getrandbits(64) for _ in range(MAX_CELLS)] for _ in SYMBOLS]
+
+@lru_cache(maxsize=None)
+def get_geometry(width, height):
+    # Precompute masks for a board of the given size: (all cells, all but left column, all but right column)
+    full = (1 << (width * height)) - 1
+    left_column = sum(1 << (y * width) for y in range(height))
+    right_column = left_column << (width - 1)
+    return full, full & ~left_column, full & ~right_column
+
+def pack_board(cells, width):
+    # Convert a row-major buffer of symbols (one byte per cell, row stride width) to a bitboard state
+    height = len(cells) // width
+    if width * height > MAX_CELLS:
+        raise ValueError(f"Board too large: at most {MAX_CELLS} cells are supported")
+    masks = [0] * len(SYMBOLS)
+    for i, block in enumerate(cells):
+        if block != ord(EMPTY):
+            masks[SYMBOL_TO_INDEX[chr(block)] - 1] |= 1 << i
+    return State(*masks, width, height)
+
+def unpack_board(state):
+    # Convert a bitboard state to a row-major bytearray of symbols (one byte per cell, row stride width)
+    cells = bytearray(EMPTY.encode() * (state.width * state.height))
+    for symbol, mask in zip(SYMBOLS, state):
+        for i in iter_bits(mask):
+            cells[i] = ord(symbol)
+    return cells
+
+def iter_bits(mask):
+    # Yield the index of every set bit in mask, in increasing order
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+def iter_cells(mask, width):
+    # Yield (x, y) for every set bit in mask, in row-major order
+    for i in iter_bits(mask):
+        yield i % width, i // width
+
+def zobrist_hash(board):
+    # Return the Zobrist hash of a board
+    key = 0
+    for color, mask in enumerate(board[:len(SYMBOLS)]):
+        keys = ZOBRIST[color]
+        for i in iter_bits(mask):
+            key ^= keys[i]
+    return key
+
+def update_zobrist(key, old_board, new_board):
+    # Update the Zobrist hash of old_board to that of new_board by toggling only the cells that changed
+    for color in range(len(SYMBOLS)):
+        keys = ZOBRIST[color]
+        for i in iter_bits(old_board[color] ^ new_board[color]):
+            key ^= keys[i]
+    return key
+
+def occupancy(state):
+    return state.B | state.G | state.P | state.O
+
+def is_within_bounds(board, x, y):
+    return 0 <= y < board.height and 0 <= x < board.width
+
+def generate_random_board(width, height):
+    return pack_board("".join(random.choices(SYMBOLS, k=width * height)).encode(), width)
+
+def is_empty(board, x, y):
+    return not (occupancy(board) >> (y * board.width + x)) & 1
+
+def is_terminal(board):
+    # Check if board is empty
+    return not occupancy(board)
+
+def min_moves_left(board):
+    # Lower bound on the number of moves needed to clear the board: at least one per color left
+    return (board.B != 0) + (board.G != 0) + (board.P != 0) + (board.O != 0)
+
+def get_non_empty_blocks(board):
+    # Return a list of coordinates for non-empty blocks
+    return list(iter_cells(occupancy(board), board.width))
+
+def flood_fill(mask, seed, width, height):
+    _, not_left, not_right = get_geometry(width, height)
+    return board_nb.flood_fill(mask, seed, width, not_left, not_right)
+
+def get_component(board, x, y):
+    # Return (color index, bitmask) of the blocks connected to (x, y)
+    bit = 1 << (y * board.width + x)
+    for color, mask in enumerate(board[:len(SYMBOLS)]):
+        if mask & bit:
+            return color, flood_fill(mask, bit, board.width, board.height)
+    return None, 0
+
+def destroy_blocks(board, x, y):
+    # Destroy a block and all connected blocks of the same color
+    color, component = get_component(board, x, y)
+    if color is None:
+        return board
+    return board._replace(**{SYMBOLS[color]: board[color] & ~component})
+
+def get_connected_blocks(board, x, y):
+    # Return a list of connected blocks starting from (x, y)
+    _, component = get_component(board, x, y)
+    return list(iter_cells(component, board.width))
+
+def get_blob_position(blob, width):
+    # Return the (x, y) coordinates of the first block of a blob in row-major order
+    i = (blob & -blob).bit_length() - 1
+    return i % width, i // width
+
+def pack_move(x, y):
+    # Pack the coordinates of a move into a single int, (y << 8) | x
+    return (y << 8) | x
+
+def unpack_move(move):
+    # Inverse of pack_move, returns (x, y)
+    return move & 0xFF, move >> 8
+
+def get_changed_cells(board, new_board):
+    # Return a mask of the cells whose content differs between two boards of the same size
+    return (board.B ^ new_board.B) | (board.G ^ new_board.G) | (board.P ^ new_board.P) | (board.O ^ new_board.O)
+
+def _collect_blobs(board, remaining, blobs):
+    # Flood fill the blobs covering the cells in remaining and append their masks to blobs
+    _, not_left, not_right = get_geometry(board.width, board.height)
+    blobs.extend(board_nb.collect_blobs(board.B, board.G, board.P, board.O, remaining, board.width, not_left, not_right).tolist())
+    return blobs
+
+def get_blobs(board):
+    # Return a list of bitmasks for each blob, ordered by their first block in row-major order
+    return _collect_blobs(board, occupancy(board), [])
+
+def update_blobs(board, parent_blobs, dirty):
+    # Return the blobs of board given the blobs of its parent board and a mask of the cells changed by
+    # the move (see get_changed_cells). A blob that neither contains nor borders a changed cell is
+    # unchanged, so only the remaining blocks need to be flood filled.
+    width = board.width
+    _, not_left, not_right = get_geometry(width, board.height)
+    touched = dirty | (dirty << width) | (dirty >> width) | ((dirty << 1) & not_left) | ((dirty >> 1) & not_right)
+    blobs = []
+    remaining = occupancy(board)
+    for blob in parent_blobs:
+        if not blob & touched:
+            blobs.append(blob)
+            remaining &= ~blob
+    _collect_blobs(board, remaining, blobs)
+    blobs.sort(key=lambda blob: blob & -blob)
+    return blobs
+
+def move_blocks_down(board):
+    # Apply gravity to board
+    full, _, _ = get_geometry(board.width, board.height)
+    return State(*board_nb.move_blocks_down(board.B, board.G, board.P, board.O, board.width, board.height, full), board.width, board.height)
+
+def read_board_from_file(filename):
+    with open(filename, "r") as f:
+        board = [line.strip() for line in f]
+    if not all(all(block in SYMBOLS for block in row) for row in board):
+        raise ValueError("Invalid board file: contains invalid symbols")
+    if not all(len(row) == len(board[0]) for row in board):
+        raise ValueError("Invalid board file: rows have different lengths")
+    return pack_board("".join(board).encode(), len(board[0]))
+
+def step(board, x, y):
+    # Simulate a click on the board at position (x, y)
+    full, not_left, not_right = get_geometry(board.width, board.height)
+    bit = 1 << (y * board.width + x)
+    return State(*board_nb.step(board.B, board.G, board.P, board.O, bit, board.width, board.height, full, not_left, not_right), board.width, board.height)
+
+def remove_blob(board, blob):
+    # Remove a blob (as returned by get_blobs) from the board and apply gravity
+    board = State(board.B & ~blob, board.G & ~blob, board.P & ~blob, board.O & ~blob, board.width, board.height)
+    return move_blocks_down(board)
+
+def playout(board, getrandbits=random.getrandbits):
+    # Play a random game until the board is empty. The game is seeded with getrandbits, e.g. the bound method of a random.Random.
+    full, not_left, not_right = get_geometry(board.width, board.height)
+    return board_nb.playout(board.B, board.G, board.P, board.O, board.width, board.height, full, not_left, not_right, getrandbits(32))
+
+def playouts(board, n_playouts, getrandbits=random.getrandbits, out=None):
+    # Play n_playouts random games from the same board and return an array with the number of moves of each.
+    # The array is written to out (an int64 array of length n_playouts) if given, so callers can reuse one buffer.
+    if out is None:
+        out = np.empty(n_playouts, dtype=np.int64)
+    full, not_left, not_right = get_geometry(board.width, board.height)
+    return board_nb.playouts(board.B, board.G, board.P, board.O, board.width, board.height, full, not_left, not_right, getrandbits(32), out)
@@ -0,0 +1,31 @@
+from termcolor import colored
+from board_core import unpack_board, step
+
+# Constants
+COLORS = {
+    "B": "blue", 
+    "G": "green",
+    "P": "magenta",
+    "O": "yellow",
+    " ": "black"
+} 
+BLOCK_CHAR = "■ "
+CURSOR_CHAR = "▲ "
+
+def print_board(board, x, y):
+    # Print the board with a cursor at position (x, y)
+    cells = unpack_board(board)
+    for i in range(board.height):
+        for j in range(board.width):
+            if i == y and j == x:
+                print(colored(CURSOR_CHAR, "red"), end="")
+            else:
+                print(colored(BLOCK_CHAR, COLORS[chr(cells[i * board.width + j])]), end="")
+        print()
+
+def print_game(board, moves):
+    # Print the board with a sequence of moves
+    for x, y in moves:
+        board = step(board, x, y)
+        print_board(board, x, y)
+        print()
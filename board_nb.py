@@ -0,0 +1,150 @@
+"""
+Numba-compiled kernels for the bitboard game logic in board_core.py.
+
+The kernels work directly on the four color masks (int64) of a board together with the masks from
+board_core.get_geometry, so that whole playouts run without touching Python objects.
+"""
+
+import numpy as np
+from numba import njit
+
+# SELECT_IN_BYTE[byte, n] is the position of the n-th lowest set bit of byte
+SELECT_IN_BYTE = np.zeros((256, 8), dtype=np.int64)
+for _byte in range(256):
+    for _n, _bit in enumerate(i for i in range(8) if _byte >> i & 1):
+        SELECT_IN_BYTE[_byte, _n] = _bit
+
+@njit(cache=True)
+def flood_fill(mask, seed, width, not_left, not_right):
+    # Grow seed to the connected component of mask containing it. Like the stack of an
+    # iterative DFS, only the cells reached in the previous iteration (the frontier) are expanded.
+    region = frontier = seed & mask
+    unvisited = mask ^ region
+    while frontier:
+        frontier = ((frontier << width) | (frontier >> width) | ((frontier << 1) & not_left) | ((frontier >> 1) & not_right)) & unvisited
+        unvisited ^= frontier
+        region |= frontier
+    return region
+
+@njit(cache=True)
+def move_blocks_down(b, g, p, o, width, height, full):
+    # Apply gravity to the color masks. All columns are compacted in parallel: in every pass, each
+    # block with an empty cell anywhere below it falls one row, so a column settles in as many
+    # passes as it has holes below its top block.
+    n_cells = width * height
+    while True:
+        occupied = b | g | p | o
+        above_hole = (full & ~occupied) >> width
+        shift = width
+        while shift < n_cells:
+            above_hole |= above_hole >> shift
+            shift <<= 1
+        falling = occupied & above_hole
+        if not falling:
+            return b, g, p, o
+        b = (b & ~falling) | ((b & falling) << width)
+        g = (g & ~falling) | ((g & falling) << width)
+        p = (p & ~falling) | ((p & falling) << width)
+        o = (o & ~falling) | ((o & falling) << width)
+
+@njit(cache=True)
+def step(b, g, p, o, bit, width, height, full, not_left, not_right):
+    # Click the cell given by the single-bit mask bit: remove its blob and apply gravity
+    if b & bit:
+        b &= ~flood_fill(b, bit, width, not_left, not_right)
+    elif g & bit:
+        g &= ~flood_fill(g, bit, width, not_left, not_right)
+    elif p & bit:
+        p &= ~flood_fill(p, bit, width, not_left, not_right)
+    elif o & bit:
+        o &= ~flood_fill(o, bit, width, not_left, not_right)
+    else:
+        return b, g, p, o
+    return move_blocks_down(b, g, p, o, width, height, full)
+
+@njit(cache=True)
+def collect_blobs(b, g, p, o, remaining, width, not_left, not_right):
+    # Flood fill the blobs covering the occupied cells in remaining. Returns an array of blob masks,
+    # ordered by their first block in row-major order.
+    blobs = np.empty(popcount(remaining), dtype=np.int64)
+    n_blobs = 0
+    while remaining:
+        low = remaining & -remaining
+        if b & low:
+            blob = flood_fill(b, low, width, not_left, not_right)
+        elif g & low:
+            blob = flood_fill(g, low, width, not_left, not_right)
+        elif p & low:
+            blob = flood_fill(p, low, width, not_left, not_right)
+        else:
+            blob = flood_fill(o, low, width, not_left, not_right)
+        remaining &= ~blob
+        blobs[n_blobs] = blob
+        n_blobs += 1
+    return blobs[:n_blobs]
+
+@njit(cache=True)
+def popcount(mask):
+    # Number of set bits in a non-negative mask (SWAR bit counting)
+    mask = mask - ((mask >> 1) & 0x5555555555555555)
+    mask = (mask & 0x3333333333333333) + ((mask >> 2) & 0x3333333333333333)
+    mask = (mask + (mask >> 4)) & 0x0F0F0F0F0F0F0F0F
+    return ((mask * 0x0101010101010101) >> 56) & 0xFF
+
+@njit(cache=True)
+def nth_set_bit(mask, n):
+    # Return the n-th lowest set bit of mask (as a single-bit mask). The byte holding it is found from
+    # the running sum of per-byte bit counts, and the bit within that byte with a table lookup.
+    counts = mask - ((mask >> 1) & 0x5555555555555555)
+    counts = (counts & 0x3333333333333333) + ((counts >> 2) & 0x3333333333333333)
+    counts = (counts + (counts >> 4)) & 0x0F0F0F0F0F0F0F0F
+    prefix = counts * 0x0101010101010101 # Byte k holds the number of set bits in bytes 0..k
+    shift = 0
+    while ((prefix >> shift) & 0xFF) <= n:
+        shift += 8
+    if shift:
+        n -= (prefix >> (shift - 8)) & 0xFF
+    return 1 << (shift + SELECT_IN_BYTE[(mask >> shift) & 0xFF, n])
+
+@njit(cache=True)
+def seed_rng(seed):
+    # Turn an integer seed into a non-zero xorshift64* state with one round of splitmix64
+    state = np.uint64(seed) + np.uint64(0x9E3779B97F4A7C15)
+    state = (state ^ (state >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    state = (state ^ (state >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    state ^= state >> np.uint64(31)
+    return state if state else np.uint64(1)
+
+@njit(cache=True)
+def next_random(state, n):
+    # Advance the xorshift64* state and draw a random integer in [0, n), n < 2^32, from the high 32 bits
+    state ^= state >> np.uint64(12)
+    state ^= state << np.uint64(25)
+    state ^= state >> np.uint64(27)
+    bits = (state * np.uint64(0x2545F4914F6CDD1D)) >> np.uint64(32)
+    return state, np.int64((bits * np.uint64(n)) >> np.uint64(32))
+
+@njit(cache=True)
+def random_game(b, g, p, o, width, height, full, not_left, not_right, state):
+    # Play a random game until the board is empty. Returns the number of moves and the new RNG state.
+    n_moves = 0
+    occupied = b | g | p | o
+    while occupied:
+        state, n = next_random(state, popcount(occupied))
+        b, g, p, o = step(b, g, p, o, nth_set_bit(occupied, n), width, height, full, not_left, not_right)
+        occupied = b | g | p | o
+        n_moves += 1
+    return n_moves, state
+
+@njit(cache=True, nogil=True)
+def playout(b, g, p, o, width, height, full, not_left, not_right, seed):
+    return random_game(b, g, p, o, width, height, full, not_left, not_right, seed_rng(seed))[0]
+
+@njit(cache=True, nogil=True)
+def playouts(b, g, p, o, width, height, full, not_left, not_right, seed, n_moves):
+    # Play one independent random game per entry of the int64 array n_moves and store the number of moves of each in it.
+    # The playout entry points release the GIL, so they can be run from several threads.
+    state = seed_rng(seed)
+    for i in range(len(n_moves)):
+        n_moves[i], state = random_game(b, g, p, o, width, height, full, not_left, not_right, state)
+    return n_moves
@@ -1,8 +1,7 @@
-from multiprocessing import Pool 
-from functools import partial
+from collections import defaultdict
 
-from mcts import MCTS
-from board import read_board_from_file, print_board
+from mcts import root_parallel_search
+from board_core import read_board_from_file
 
 # Parameters
 n_processes = 64
@@ -13,25 +12,21 @@ time_limit = 30
 selection_threshold = 10
 C = 10.0
 D = 1.0
-
-def run_mcts(seed, board, selection_threshold, C, D):
-    mcts = MCTS(board, seed, selection_threshold, C, D)
-    return mcts.search(time_limit)
+n_playouts = 8 # Playouts per simulated leaf
 
 board = read_board_from_file(board_file)
-solutions = []
-
-func = partial(run_mcts, board=board, selection_threshold=selection_threshold, C=C, D=D)
-with Pool(n_processes) as p:
-    seeds = list(range(n_processes))
-    solutions += p.map(func, seeds)
-
-best_solution = []
-for solution in solutions:
-    if len(solution) == 0:
-        continue
-    if len(solution) < len(best_solution) or len(best_solution) == 0:
-        best_solution = solution
+best_solution, root_statistics = root_parallel_search(board, n_processes, time_limit, selection_threshold=selection_threshold, C=C, D=D, n_playouts=n_playouts)
+
+# Root parallelization: merge the statistics of the root children over all trees
+root_visits = defaultdict(int)
+root_score_sums = defaultdict(float)
+for statistics in root_statistics:
+    for move, n_visits, average_score in statistics:
+        root_visits[move] += n_visits
+        root_score_sums[move] += n_visits * average_score
+if root_visits:
+    best_move = max(root_visits, key=lambda move: root_score_sums[move] / root_visits[move])
+    print(f"Best first move: {best_move} (visits: {root_visits[best_move]}, average score: {root_score_sums[best_move] / root_visits[best_move]:.2f})")
 
 print(f"Best solution: {best_solution}")
 print(f"Number of moves: {len(best_solution)}")
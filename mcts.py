@@ -8,20 +8,65 @@ References:
 
 import math
 import random
+from multiprocessing import Pool
 from time import time
-from board import playout, step, is_terminal, get_blobs, copy_board
+import numpy as np
+from board_core import playouts, is_terminal, min_moves_left, get_blobs, update_blobs, remove_blob, get_blob_position, pack_move, unpack_move, get_changed_cells, zobrist_hash, update_zobrist
+
+TIME_CHECK_INTERVAL = 1024 # Number of iterations between checks of the time limit
+STATS_CHUNK_SIZE = 1 << 16 # Number of nodes the statistics arrays grow by when full
+LOOKUP_TABLE_SIZE = 1 << 16 # Visit counts below this use the precomputed tables in uct
+SQRT_LOG_TABLE = np.sqrt(np.log(np.maximum(np.arange(LOOKUP_TABLE_SIZE), 1))) # sqrt(log(n))
+INV_SQRT_TABLE = 1.0 / np.sqrt(np.maximum(np.arange(LOOKUP_TABLE_SIZE), 1)) # 1 / sqrt(n)
+
+class NodeArena:
+    # Node statistics as parallel arrays (structure of arrays) indexed by node id
+    def __init__(self, capacity=STATS_CHUNK_SIZE):
+        self.n_nodes = 0
+        self.visits = np.zeros(capacity, dtype=np.int64) # Number of playouts through the node
+        self.avg = np.zeros(capacity, dtype=np.float64) # Average score of the node
+        self.sqsum = np.zeros(capacity, dtype=np.float64) # Sum of the square of the scores
+
+    def allocate(self):
+        # Return the id of a new node, growing the arrays by a chunk when they are full
+        if self.n_nodes == len(self.visits):
+            self.visits = np.concatenate([self.visits, np.zeros(STATS_CHUNK_SIZE, dtype=np.int64)])
+            self.avg = np.concatenate([self.avg, np.zeros(STATS_CHUNK_SIZE, dtype=np.float64)])
+            self.sqsum = np.concatenate([self.sqsum, np.zeros(STATS_CHUNK_SIZE, dtype=np.float64)])
+        self.n_nodes += 1
+        return self.n_nodes - 1
 
 class Node:
-    def __init__(self, board, depth, parent=None, move=None):
-        self.board = [row[:] for row in board] # Copy of the board state
-        self.parent = parent # Parent node
-        self.move = move # (x, y) coordinates of the move that led to this node
-        self.blobs = get_blobs(self.board) # List of blobs in the board (possible moves)
+    # Structural part of a tree node. The statistics live in the NodeArena arrays, indexed by id.
+    # The attributes are fixed, so __slots__ saves the per-instance __dict__ of the many nodes in a tree.
+    __slots__ = ("id", "board", "zobrist", "parent", "move", "_blobs", "_parent_blobs", "_dirty", "children", "children_idx", "depth", "lower_bound", "is_terminal")
+
+    def __init__(self, node_id, board, depth, parent=None, move=None, parent_blobs=None, dirty=0, zobrist=None):
+        self.id = node_id # Index of the node in the statistics arrays
+        self.board = board # Board state (immutable, so no copy is needed)
+        self.zobrist = zobrist_hash(board) if zobrist is None else zobrist # Zobrist hash of the board state
+        self.parent = parent # Parent node (the first one, if the node is shared through the transposition table)
+        self.move = move # Move that led to this node, as packed by pack_move
+        self._blobs = None # Computed on first access, see blobs
+        self._parent_blobs = parent_blobs
+        self._dirty = dirty # Cells changed by the move, see update_blobs
         self.children = [] # List of nodes that are children of this node
-        self.n_visits = 0 # Number of times this node has been visited
-        self.average_score = 0.0 # Average score of the node
-        self.square_sum_score = 0.0 # Sum of the square of the scores
+        self.children_idx = None # Array of the ids of the children, allocated when the first child is expanded
         self.depth = depth
+        self.lower_bound = depth + min_moves_left(board) # No solution through this node is shorter than this
+        self.is_terminal = is_terminal(board) # Whether the board is solved (no blobs left)
+
+    @property
+    def blobs(self):
+        # List of blob bitmasks in the board (possible moves). Many nodes are only simulated once and
+        # never selected again, so the blobs are not computed until they are needed.
+        if self._blobs is None:
+            if self._parent_blobs is None:
+                self._blobs = get_blobs(self.board)
+            else:
+                self._blobs = update_blobs(self.board, self._parent_blobs, self._dirty)
+                self._parent_blobs = None
+        return self._blobs
 
     def is_leaf(self):
         return len(self.children) < len(self.blobs)
@@ -30,29 +75,64 @@ class MCTS:
     """
     Only use UTC for selection strategy if all children are explored
     """
-    def __init__(self, board, seed=0, selection_threshold=1000, C=0.1, D=100):
-        self.board = [row[:] for row in board]
-        self.root = Node(board, depth=0)
+    def __init__(self, board, seed=0, selection_threshold=1000, C=0.1, D=100, n_playouts=1, max_cached_playouts=32):
+        self.board = board
+        self.arena = NodeArena()
+        self.root = Node(self.arena.allocate(), board, depth=0)
+        self.transpositions = {(self.root.zobrist, 0): self.root} # (Zobrist hash, depth) -> Node
         self.selection_threshold = selection_threshold
         self.C = C
         self.D = D
+        self.n_playouts = n_playouts # Number of playouts per simulation (leaf parallelization)
+        self.max_cached_playouts = max_cached_playouts # Real playouts per position before their lengths are sampled instead
+        self.rollout_cache = {} # Zobrist hash -> [count, sum, sum of squares] of playout lengths from the position
+        self.playout_buffer = np.empty(n_playouts, dtype=np.int64) # Reused output array of the batched playouts
+        # Score of a game finished in n moves is score_table[n]. Every move removes at least one block, so n <= width * height.
+        max_moves = board.width * board.height
+        self.score_table = [self.score(n_moves, max_moves) for n_moves in range(max_moves + 1)]
         self.solution_found = False
         self.best_solution = None
         self.rng = random.Random(seed)
+        # Bound methods of the RNG, to avoid attribute lookups in the hot loop
+        self._choice = self.rng.choice
+        self._gauss = self.rng.gauss
+        self._getrandbits = self.rng.getrandbits
+        # Compile (or load from the cache) the jitted kernels before the search clock starts
+        playouts(board, 1)
+        self.root.blobs
 
-    def search(self, time_limit=1.0):
-        # Run the MCTS algorithm for a given time limit
-        t0 = time()
-        node = self.root
+    def search(self, time_limit=1.0, max_iterations=None, patience=None):
+        # Run the MCTS algorithm for a given time limit. Optionally also stop after exactly max_iterations iterations, or when the
+        # best solution has not improved for patience iterations (checked once per batch of TIME_CHECK_INTERVAL iterations).
+        now = time
+        t0 = now()
+        deadline = t0 + time_limit
+        # Bind the methods to locals to avoid attribute lookups in the loop
+        select, expand, simulate, backpropagate = self.select, self.expand, self.simulate, self.backpropagate
         iter_count = 0
-        while time() - t0 < time_limit:# or not self.solution_found:
-            node = self.select()
-            if node.is_leaf():
-                node = self.expand(node)
-            score = self.simulate(node)
-            self.backpropagate(node, score)
-            iter_count += 1
-        t1 = time()
+        last_improvement = 0 # Iteration count at the last batch that improved the best solution
+        best_depth = self.best_solution_depth()
+        while True:
+            # Only check the clock once per batch of iterations. The last batch is cut short to stay within max_iterations.
+            batch_size = TIME_CHECK_INTERVAL if max_iterations is None else min(TIME_CHECK_INTERVAL, max_iterations - iter_count)
+            for _ in range(batch_size):
+                node, path = select()
+                if node.is_leaf():
+                    node = expand(node)
+                    path.append(node.id)
+                backpropagate(path, *simulate(node))
+            iter_count += batch_size
+            if self.best_solution_depth() < best_depth:
+                best_depth = self.best_solution_depth()
+                last_improvement = iter_count
+            if now() >= deadline or self.root.lower_bound >= best_depth:
+                # Stop when out of time or when every branch is pruned (the best solution is optimal)
+                break
+            if max_iterations is not None and iter_count >= max_iterations:
+                break
+            if patience is not None and self.best_solution is not None and iter_count - last_improvement >= patience:
+                break
+        t1 = now()
 
         if self.best_solution is None:
             return []
@@ -60,76 +140,169 @@ class MCTS:
         moves = []
         node = self.best_solution
         while node.parent is not None:
-            moves.append(node.move)
+            moves.append(unpack_move(node.move))
             node = node.parent
         moves.reverse()
         print(f"Finished {iter_count} iterations in {t1 - t0:.2f} seconds. Found solution with {len(moves)} moves.")
         return moves
 
+    def best_solution_depth(self):
+        # Number of moves of the best solution found so far (infinite if none)
+        return math.inf if self.best_solution is None else self.best_solution.depth
+
+    def root_statistics(self):
+        # Return ((x, y), n_visits, average_score) for every child of the root
+        return [(unpack_move(child.move), int(self.arena.visits[child.id]), float(self.arena.avg[child.id])) for child in self.root.children]
+
     def select(self):
+        # Descend from the root to a leaf. Returns the leaf and the ids of the nodes on the path from the root to it.
         node = self.root
+        path = [node.id]
         while not node.is_leaf():
-            if is_terminal(node.board):
+            if node.is_terminal:
                 self.solution_found = True
                 if self.best_solution is None or node.depth < self.best_solution.depth:
                     self.best_solution = node
-                return node
-            node = self.selection_strategy(node)
-        return node
+                return node, path
+            child = self.selection_strategy(node)
+            if child is None:
+                # Every child is dominated by the best solution, so this node is too. Raise its bound so that its parent
+                # prunes it from now on, and stop the descent here.
+                node.lower_bound = self.best_solution.depth
+                return node, path
+            node = child
+            path.append(node.id)
+        return node, path
 
     def selection_strategy(self, node):
         if node.is_leaf():
             node = self.expand(node)
             return node
 
-        if node.n_visits < self.selection_threshold:
+        children = node.children
+        candidates = None
+        if self.best_solution is not None:
+            # Prune children that cannot lead to a shorter solution than the best one found so far
+            best_depth = self.best_solution.depth
+            candidates = [child.lower_bound < best_depth for child in children]
+            if not any(candidates):
+                return None
+
+        if self.arena.visits[node.id] < self.selection_threshold:
             # pick a random child node 
-            return self.rng.choice(node.children)
-        child_uct_values = [self.uct(node, child) for child in node.children]
-        max_uct_index = max(range(len(child_uct_values)), key=child_uct_values.__getitem__)
-        max_uct_child = node.children[max_uct_index]
+            if candidates is not None:
+                children = [child for child, candidate in zip(children, candidates) if candidate]
+            return self._choice(children)
+        uct_values = self.uct(node)
+        if candidates is not None:
+            uct_values[~np.array(candidates)] = -np.inf
+        max_uct_index = int(uct_values.argmax())
+        max_uct_child = children[max_uct_index]
         return max_uct_child
 
-    def uct(self, parent, child):
-        # Modified UCT formula from equation (1) in [1]
-        x_bar = child.average_score
-        n = parent.n_visits
-        n_i = child.n_visits
-        x_ss = child.square_sum_score
-        uct = x_bar + self.C * math.sqrt(math.log(n) / n_i) + math.sqrt((x_ss - n_i * x_bar**2 + self.D) / n_i)
+    def uct(self, parent):
+        # Modified UCT formula from equation (1) in [1], evaluated for all children of parent at once. The children are all
+        # expanded, so children_idx is full and indexes the statistics arrays without a list to array conversion.
+        # Both square root terms share the factor 1 / sqrt(n_i), which is looked up together with sqrt(log(n)).
+        children_idx, arena = parent.children_idx, self.arena
+        x_bar = arena.avg[children_idx]
+        n = arena.visits[parent.id]
+        n_i = arena.visits[children_idx]
+        x_ss = arena.sqsum[children_idx]
+        sqrt_log_n = SQRT_LOG_TABLE[n] if n < LOOKUP_TABLE_SIZE else math.sqrt(math.log(n))
+        inv_sqrt_n_i = INV_SQRT_TABLE[n_i] if n_i.max() < LOOKUP_TABLE_SIZE else 1.0 / np.sqrt(n_i)
+        uct = x_bar + (self.C * sqrt_log_n + np.sqrt(x_ss - n_i * x_bar * x_bar + self.D)) * inv_sqrt_n_i
         return uct
 
     def simulate(self, node):
-        # Random playout from the current node
-        board_copy = [row[:] for row in node.board]
-        n_moves = playout(board_copy, self.rng) + node.depth
-        score = self.score(n_moves)
-        return score
+        # Random playouts from the current node. Returns (number of playouts, sum of scores, sum of squared scores)
+        # Playout lengths only depend on the position, so positions reached again (through transpositions at other depths or
+        # terminal nodes) reuse the cached lengths: once enough are cached, new ones are drawn from a normal distribution fit to them.
+        score_table, depth, gauss = self.score_table, node.depth, self._gauss
+        stats = self.rollout_cache.get(node.zobrist)
+        if stats is not None and stats[0] >= self.max_cached_playouts:
+            count, total, square_total = stats
+            mean = total / count
+            std = math.sqrt(max(square_total / count - mean * mean, 0.0))
+            # Clamp the samples to the lengths a game from this position can actually have
+            min_n_moves = min_moves_left(node.board)
+            max_n_moves = len(score_table) - 1 - depth
+            lengths = [min(max(round(gauss(mean, std)), min_n_moves), max_n_moves) for _ in range(self.n_playouts)]
+        else:
+            lengths = playouts(node.board, self.n_playouts, self._getrandbits, self.playout_buffer).tolist()
+            if stats is None:
+                stats = self.rollout_cache[node.zobrist] = [0, 0, 0]
+            stats[0] += len(lengths)
+            stats[1] += sum(lengths)
+            stats[2] += sum(n_moves * n_moves for n_moves in lengths)
+        scores = [score_table[n_moves + depth] for n_moves in lengths]
+        return len(scores), sum(scores), sum(score * score for score in scores)
 
-    def score(self, n_moves):
-        # Scoring function for the playout
-        score = 10 * max(63 - n_moves, 0)
+    def score(self, n_moves, max_moves):
+        # Scoring function for the playout (tabulated in score_table)
+        score = 10 * max(max_moves - n_moves, 0)
         return score
     
     def expand(self, node):
         blob = node.blobs[len(node.children)]
-        board_copy = [row[:] for row in node.board]
-        board_copy = step(board_copy, *blob)
-        child = Node(board_copy, depth=node.depth + 1, parent=node, move=blob)
+        board = remove_blob(node.board, blob)
+        move = pack_move(*get_blob_position(blob, board.width))
+        zobrist = update_zobrist(node.zobrist, node.board, board)
+        # The score depends on the depth, so only nodes reached with the same number of moves are shared
+        key = (zobrist, node.depth + 1)
+        child = self.transpositions.get(key)
+        if child is None or child.board != board:
+            dirty = get_changed_cells(node.board, board)
+            child = Node(self.arena.allocate(), board, depth=node.depth + 1, parent=node, move=move, parent_blobs=node.blobs, dirty=dirty, zobrist=zobrist)
+            self.transpositions[key] = child
+        if not node.children:
+            node.children_idx = np.empty(len(node.blobs), dtype=np.int64)
+        node.children_idx[len(node.children)] = child.id
         node.children.append(child)
         return child
 
-    def backpropagate(self, node, score):
-        # Update the node and its ancestor's statistics 
-        while node is not None:
-            node.n_visits += 1
-            node.average_score = (node.average_score * (node.n_visits - 1) + score) / node.n_visits
-            node.square_sum_score += score**2
-            node = node.parent
+    def backpropagate(self, path, n_scores, score_sum, square_sum):
+        # Update the statistics of the nodes on the selected path with a batch of n_scores playout scores.
+        # Following the path rather than the parent pointers credits the parent a shared node was actually reached from.
+        # The path never repeats a node, so the fancy-indexed updates are safe.
+        arena = self.arena
+        # The averages are updated incrementally, avg += (sum - n * avg) / n_visits, instead of rescaling the old sum
+        n_visits = arena.visits[path] + n_scores
+        arena.visits[path] = n_visits
+        avg = arena.avg[path]
+        arena.avg[path] = avg + (score_sum - n_scores * avg) / n_visits
+        arena.sqsum[path] += square_sum
 
     def max_depth(self, node):
-        # Get the maximum depth of the tree
-        if not node.children:
-            return 0
-        return 1 + max(self.max_depth(child) for child in node.children)
+        # Get the maximum depth of the tree below node, with an explicit stack instead of recursion. Every move
+        # increases the depth by one, so shared nodes are the same distance from node on every path and are only visited once.
+        deepest = node.depth
+        visited = {node.id}
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            deepest = max(deepest, current.depth)
+            for child in current.children:
+                if child.id not in visited:
+                    visited.add(child.id)
+                    stack.append(child)
+        return deepest - node.depth
+
+def _init_worker(board):
+    # Pool initializer. The board is handed over once when the worker is forked instead of with every task.
+    global _worker_board
+    _worker_board = board
+
+def _run_worker(seed, time_limit, mcts_kwargs):
+    mcts = MCTS(_worker_board, seed, **mcts_kwargs)
+    solution = mcts.search(time_limit)
+    return solution, mcts.root_statistics()
 
+def root_parallel_search(board, n_workers, time_limit, seed=0, **mcts_kwargs):
+    # Root parallelization: run n_workers independent searches (seeds seed, seed + 1, ...) in separate processes.
+    # The trees share nothing, so no locks are needed. Returns the shortest solution found and the root statistics of every tree.
+    with Pool(n_workers, initializer=_init_worker, initargs=(board,)) as pool:
+        results = pool.starmap(_run_worker, [(seed + i, time_limit, mcts_kwargs) for i in range(n_workers)])
+    solutions = [solution for solution, _ in results if solution]
+    best_solution = min(solutions, key=len) if solutions else []
+    return best_solution, [statistics for _, statistics in results]